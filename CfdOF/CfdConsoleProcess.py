@@ -27,7 +27,7 @@ import platform
 import os
 import sys
 from PySide import QtCore
-from PySide.QtCore import QProcess, QTextStream
+from PySide.QtCore import QProcess
 import FreeCAD
 
 
@@ -94,11 +94,12 @@ class CfdConsoleProcess:
             #print("Error: finished wasn't hooked to a handler")
 
     def readStdout(self):
-        # Ensure only complete lines are passed on
-        text = ""
+        # Ensure only complete lines are passed on. Accumulate the raw bytes and
+        # decode the whole chunk once, rather than one QTextStream per line
+        data = bytearray()
         while self.process.canReadLine():
-            byte_arr = self.process.readLine()
-            text += QTextStream(byte_arr).readAll()
+            data += bytes(self.process.readLine())
+        text = data.decode('utf-8', 'replace')
         if text:
             if self.stdoutHook:
                 new_text = self.stdoutHook(text)
@@ -113,10 +114,10 @@ class CfdConsoleProcess:
     def readStderr(self):
         # Ensure only complete lines are passed on. Print any error output to console
         self.process.setReadChannel(QProcess.StandardError)
-        text = ""
+        data = bytearray()
         while self.process.canReadLine():
-            byte_arr = self.process.readLine()
-            text += QTextStream(byte_arr).readAll()
+            data += bytes(self.process.readLine())
+        text = data.decode('utf-8', 'replace')
         self.process.setReadChannel(QProcess.StandardOutput)
         if text:
             if self.stderrHook:
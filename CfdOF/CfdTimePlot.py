@@ -23,6 +23,7 @@
 
 from PySide import QtCore
 import math
+import numpy
 import FreeCAD
 
 if int(FreeCAD.Version()[0]) == 0 and int(FreeCAD.Version()[1].split('.')[0]) < 20:
@@ -47,6 +48,7 @@ class TimePlot:
         self.updated = False
         self.times = []
         self.values = {}
+        self.lines = {}
         self.transient = False
         self.ax_lim = 0
 
@@ -60,6 +62,7 @@ class TimePlot:
 
     def figureClosed(self):
         self.fig = None
+        self.lines = {}
 
     def updateValues(self, times, values):
         self.updated = True
@@ -71,6 +74,13 @@ class TimePlot:
         solver_obj = CfdTools.getSolver(analysis_obj)
         self.transient = (phys_model.Time == 'Transient')
         self.values = {}
+        # Remove any artists left over from the previous run and restart the
+        # colour cycle so each field keeps the same colour from run to run
+        for line in self.lines.values():
+            line.remove()
+        if self.lines and self.fig is not None:
+            self.fig.axes.set_prop_cycle(None)
+        self.lines = {}
         self.ax_lim = 100*solver_obj.TimeStep.getValueAs(Units.TimeSpan).Value if self.transient else 100
 
     def refresh(self):
@@ -79,30 +89,51 @@ class TimePlot:
             if self.fig is None:
                 self.fig = Plot.figure(FreeCAD.ActiveDocument.Name + ' : ' + self.title)
                 self.fig.destroyed.connect(self.figureClosed)
+                self.lines = {}
             ax = self.fig.axes
-            ax.cla()
             ax.set_title(self.title)
             time_unit = str(Units.Quantity(1, Units.TimeSpan)).split()[-1]
             ax.set_xlabel("Time [{}]".format(time_unit) if self.transient else "Iteration")
             ax.set_ylabel(self.y_label)
+            ax.grid(True)
 
+            # Update the existing line artists in place rather than clearing and
+            # re-creating them - replotting from scratch makes the total plotting
+            # work over a run grow quadratically with the number of iterations
             last_values_min = 1e-2
+            lines_added = False
             for k in self.values:
-                if self.values[k]:
-                    ax.plot(self.times[0:len(self.values[k])], self.values[k], label=k, linewidth=1)
-                    last_values_min = min([last_values_min]+self.values[k][1:-1])
+                # Values may be a list or a numpy column view with nan for
+                # iterations where this quantity was not reported
+                values = numpy.asarray(self.values[k], dtype=numpy.float64)
+                if len(values) and not numpy.isnan(values).all():
+                    if k not in self.lines:
+                        self.lines[k], = ax.plot([], [], label=k, linewidth=1)
+                        lines_added = True
+                    self.lines[k].set_data(self.times[0:len(values)], values)
+                    middle = values[1:-1]
+                    if len(middle) and not numpy.isnan(middle).all():
+                        middle_min = numpy.nanmin(middle)
+                        # A fully converged field can report exactly zero, which
+                        # must not reach the log10 below
+                        if middle_min > 0:
+                            last_values_min = min(last_values_min, middle_min)
 
-            ax.grid()
             if self.is_logarithmic:
                 ax.set_yscale('log')
                 # Decrease in increments of 10
                 ax.set_ylim([10**(math.floor(math.log10(last_values_min))), 1])
-
-            while float(self.times[-1]) > self.ax_lim:
-                # Increase scale by 10%
-                self.ax_lim *= 1.1
-            ax.set_xlim([0, self.ax_lim])
+            else:
+                ax.relim()
+                ax.autoscale_view(scalex=False, scaley=True)
 
             if len(self.times):
-                ax.legend(loc='lower left')
+                while float(self.times[-1]) > self.ax_lim:
+                    # Increase scale by 10%
+                    self.ax_lim *= 1.1
+                ax.set_xlim([0, self.ax_lim])
+
+            if self.lines:
+                if lines_added:
+                    ax.legend(loc='lower left')
                 self.fig.canvas.draw()
@@ -26,15 +26,96 @@
 from __future__ import print_function
 
 import os
+import re
+import time
+import array
+import queue
+import numpy
 import FreeCAD
 from FreeCAD import Units
 from CfdOF import CfdTools
 from CfdOF import CfdAnalysis
-from PySide.QtCore import QObject, Signal
+from PySide.QtCore import QObject, QThread, Signal
 from collections import OrderedDict
 
 from CfdOF.CfdTimePlot import TimePlot
 
+# One row per residual field as named in the solver log, with its plot label.
+# Fields sharing a label (p/p_rgh, h/E) share a storage column. Adding a
+# variable here updates the scanner, the column map and the plot legend together
+RESIDUAL_FIELDS = (
+    ('rho', '$\\rho$'),
+    ('Ux', '$U_x$'),
+    ('Uy', '$U_y$'),
+    ('Uz', '$U_z$'),
+    ('p', '$p$'),
+    ('p_rgh', '$p$'),
+    ('h', '$E$'),
+    ('E', '$E$'),
+    ('k', '$k$'),
+    ('epsilon', '$\\epsilon$'),
+    ('nuTilda', '$\\tilde{\\nu}$'),
+    ('omega', '$\\omega$'),
+    ('gammaInt', '$\\gamma$'),
+    ('ReThetat', '$Re_{\\theta}$'))
+
+# Unique labels in declaration order give the column layout of the residuals array
+RESIDUAL_LABELS = tuple(dict.fromkeys(label for name, label in RESIDUAL_FIELDS))
+RESIDUAL_COLS = {name: RESIDUAL_LABELS.index(label) for name, label in RESIDUAL_FIELDS}
+
+# rho and E are only recorded from the HiSA coupled residual line, never from
+# 'Solving for' lines: buoyant solvers report rho via the diagonal solver as a
+# degenerate all-zero line every step, which must not reach the log-scale plot
+COUPLED_ONLY_FIELDS = ('rho', 'E')
+
+# Compiled once at import - a single alternation scan per line is much cheaper
+# than testing every field name against the tokenised line
+TIME_RE = re.compile(r"^Time = (\S+)")
+RESIDUAL_RE = re.compile(
+    r"Solving for ("
+    + '|'.join(sorted((name for name, label in RESIDUAL_FIELDS
+                       if name not in COUPLED_ONLY_FIELDS), key=len, reverse=True))
+    + r"), Initial residual = ([0-9eE.+\-]+)")
+# HiSA coupled solver reports all residuals on one line
+HISA_RE = re.compile(r"Residual: (\S+) \((\S+) (\S+) (\S+)\) (\S+)")
+FORCE_RE = re.compile(r"([Pp]ressure|[Vv]iscous)\s*:?\s*\((\S+) (\S+) (\S+)\)")
+COEFF_RE = re.compile(r"\b(Cd|Cl)\b\s*[:=]?\s*(-?[0-9.][0-9.eE+\-]*)")
+
+
+class LogParserThread(QThread):
+    """
+    Parses solver output on a worker thread so that the subprocess pipe is
+    never stalled behind parsing or plot updates on the GUI thread
+    """
+    def __init__(self, runnable, chunk_queue):
+        super(LogParserThread, self).__init__()
+        self.runnable = runnable
+        self.queue = chunk_queue
+
+    def run(self):
+        running = True
+        while running:
+            chunks = [self.queue.get()]
+            if chunks[0] is None:
+                break
+            # Drain anything else already queued so a burst is parsed in one pass
+            try:
+                while True:
+                    c = self.queue.get_nowait()
+                    if c is None:
+                        running = False
+                        break
+                    chunks.append(c)
+            except queue.Empty:
+                pass
+            try:
+                self.runnable.parseOutput(''.join(chunks))
+            except Exception as e:
+                # A malformed line must not kill the parser thread and silently
+                # stop all subsequent plotting
+                FreeCAD.Console.PrintError(
+                    "Error parsing solver output: {}\n".format(str(e)))
+
 
 class CfdRunnable(QObject, object):
 
@@ -69,6 +150,21 @@ class CfdRunnable(QObject, object):
 class CfdRunnableFoam(CfdRunnable):
     update_residual_signal = Signal(list, list, list, list)
 
+    # Order in which HISA_RE reports the coupled residuals
+    _HISA_FIELDS = ('rho', 'Ux', 'Uy', 'Uz', 'E')
+    # Static label templates for the plotters, so the OrderedDicts passed to
+    # updateValues are built from interned strings rather than re-created literals
+    _FORCE_LABELS = (
+        ('$Pressure_x$', 'pressureXForces'),
+        ('$Pressure_y$', 'pressureYForces'),
+        ('$Pressure_z$', 'pressureZForces'),
+        ('$Viscous_x$', 'viscousXForces'),
+        ('$Viscous_y$', 'viscousYForces'),
+        ('$Viscous_z$', 'viscousZForces'))
+    _COEFF_LABELS = (
+        ('$C_D$', 'cdCoeffs'),
+        ('$C_L$', 'clCoeffs'))
+
     def __init__(self, analysis=None, solver=None):
         super(CfdRunnableFoam, self).__init__(analysis, solver)
 
@@ -76,6 +172,9 @@ class CfdRunnableFoam(CfdRunnable):
         self.force_coeffs = {}
         self.probes = {}
 
+        self._output_queue = queue.Queue()
+        self._parser_thread = None
+
         self.constructAncillaryPlotters()
 
         self.initResiduals()
@@ -85,26 +184,27 @@ class CfdRunnableFoam(CfdRunnable):
         return ""
 
     def initResiduals(self):
-        self.UxResiduals = []
-        self.UyResiduals = []
-        self.UzResiduals = []
-        self.pResiduals = []
-        self.rhoResiduals = []
-        self.EResiduals = []
-        self.kResiduals = []
-        self.epsilonResiduals = []
-        self.omegaResiduals = []
-        self.nuTildaResiduals = []
-        self.gammaIntResiduals = []
-        self.ReThetatResiduals = []
-
-        self.time = []
+        # One contiguous (iteration, field) array rather than a list per field -
+        # entries never solved for remain nan, and plotting takes zero-copy column
+        # views instead of converting lists
+        self.residuals = numpy.full((1024, len(RESIDUAL_LABELS)), numpy.nan)
+        # Number of iterations recorded so far in each column, to record only the
+        # first residual reported per outer iteration
+        self.residuals_filled = [0]*len(RESIDUAL_LABELS)
+
+        # Typed buffers store doubles unboxed and convert to numpy without a
+        # per-element copy when plotted
+        self.time = array.array('d')
         self.niter = 0
         self.latest_time = 0
         self.prev_time = 0
         self.latest_outer_iter = 0
         self.prev_num_outer_iters = 0
 
+        self._last_plotted_niter = 0
+        self._last_plot_time = 0
+        self._line_buf = ""
+
         self.solver.Proxy.residual_plotter.reInitialise(self.analysis)
 
     def initMonitors(self):
@@ -112,32 +212,46 @@ class CfdRunnableFoam(CfdRunnable):
         self.in_forces_section = None
         self.in_forcecoeffs_section = None
 
+        # Prefixes the line prefilter must let through - the monitor section
+        # headers only matter if such reporting functions actually exist
+        prefixes = ['Time = ']
+        if self.forces:
+            prefixes.append('forces')
+        if self.force_coeffs:
+            prefixes.append('forceCoeffs')
+        self._line_prefixes = tuple(prefixes)
+
         for fn in self.forces:
             f = self.forces[fn]
 
-            f['pressureXForces'] = []
-            f['pressureYForces'] = []
-            f['pressureZForces'] = []
+            f['pressureXForces'] = array.array('d')
+            f['pressureYForces'] = array.array('d')
+            f['pressureZForces'] = array.array('d')
+
+            f['viscousXForces'] = array.array('d')
+            f['viscousYForces'] = array.array('d')
+            f['viscousZForces'] = array.array('d')
 
-            f['viscousXForces'] = []
-            f['viscousYForces'] = []
-            f['viscousZForces'] = []
+            # Built once with references to the lists themselves; the dict stays
+            # live as they grow, so updatePlots passes it straight through
+            f['plot_values'] = OrderedDict((label, f[key]) for label, key in self._FORCE_LABELS)
 
         for fn in self.solver.Proxy.forces_plotters:
             self.solver.Proxy.forces_plotters[fn].reInitialise(self.analysis)
 
         for fcn in self.force_coeffs:
             fc = self.force_coeffs[fcn]
-            fc['cdCoeffs'] = []
-            fc['clCoeffs'] = []
+            fc['cdCoeffs'] = array.array('d')
+            fc['clCoeffs'] = array.array('d')
+            fc['plot_values'] = OrderedDict((label, fc[key]) for label, key in self._COEFF_LABELS)
         for fcn in self.solver.Proxy.force_coeffs_plotters:
             self.solver.Proxy.force_coeffs_plotters[fcn].reInitialise(self.analysis)
 
         for pn in self.probes:
             p = self.probes[pn]
             p['file'] = None
-            p['time'] = []
-            p['values'] = [[]]
+            p['time'] = array.array('d')
+            p['values'] = [array.array('d')]
         for pn in self.solver.Proxy.probes_plotters:
             self.solver.Proxy.probes_plotters[pn].reInitialise(self.analysis)
 
@@ -178,17 +292,77 @@ class CfdRunnableFoam(CfdRunnable):
                         self.solver.Proxy.probes_plotters[rf.Label] = \
                             TimePlot(title=rf.Label, y_label=rf.SampleFieldName, is_log=False)
 
+    def appendTime(self):
+        # Add a point to the time axis for each outer iteration
+        if self.niter > len(self.time):
+            self.time.append(self.latest_time)
+            if self.latest_outer_iter > 0:
+                # Outer-iteration case
+                # Create virtual times to space the residuals of the outer iterations nicely on the time graph
+                self.prev_num_outer_iters = max(self.prev_num_outer_iters, self.latest_outer_iter)
+                for i in range(self.latest_outer_iter):
+                    self.time[-(self.latest_outer_iter-i)] = self.prev_time + (
+                        self.latest_time-self.prev_time)*((i+1)/self.prev_num_outer_iters)
+
+    def setResidual(self, col, value):
+        # Record only the first residual per outer iteration
+        if self.residuals_filled[col] < self.niter:
+            if self.niter > self.residuals.shape[0]:
+                # Amortised doubling
+                grown = numpy.full((2*self.residuals.shape[0], self.residuals.shape[1]), numpy.nan)
+                grown[:self.residuals.shape[0]] = self.residuals
+                self.residuals = grown
+            self.residuals[self.niter-1, col] = float(value)
+            self.residuals_filled[col] = self.niter
+
+    def updatePlots(self):
+        self._last_plotted_niter = self.niter
+        self._last_plot_time = time.monotonic()
+
+        self.solver.Proxy.residual_plotter.updateValues(self.time, OrderedDict(
+            (label, self.residuals[0:self.niter, col])
+            for col, label in enumerate(RESIDUAL_LABELS)))
+
+        for fn in self.forces:
+            self.solver.Proxy.forces_plotters[fn].updateValues(
+                self.time, self.forces[fn]['plot_values'])
+
+        for fcn in self.force_coeffs:
+            self.solver.Proxy.force_coeffs_plotters[fcn].updateValues(
+                self.time, self.force_coeffs[fcn]['plot_values'])
+
     def process_output(self, text):
-        log_lines = text.split('\n')[:-1]
-        prev_niter = self.niter
+        # Hand the chunk off to the parser thread and return immediately so the
+        # subprocess reader is not blocked
+        if self._parser_thread is None:
+            self._parser_thread = LogParserThread(self, self._output_queue)
+            self._parser_thread.start()
+        self._output_queue.put(text)
+
+    def parseOutput(self, text):
+        # Carry over any partial trailing line so a residual split across two
+        # chunks is not lost
+        data = self._line_buf + text
+        log_lines = data.split('\n')
+        self._line_buf = log_lines.pop()
         for line in log_lines:
             line = line.rstrip()
-            split = line.split()
+
+            # The overwhelming majority of log lines are banners and solver
+            # chatter; outside the force monitor sections, discard them with
+            # cheap C-level substring tests before any regex or split work
+            if self.in_forces_section is None and self.in_forcecoeffs_section is None:
+                if not (line.startswith(self._line_prefixes)
+                        or 'Solving for ' in line
+                        or 'Residual: ' in line
+                        or 'iteration ' in line):
+                    continue
 
             # Only record the first residual per outer iteration
-            if line.startswith(u"Time = "):
+            m = TIME_RE.match(line)
+            if m:
                 try:
-                    time_val = float(line.lstrip(u"Time = "))
+                    time_val = float(m.group(1))
                 except ValueError:
                     pass
                 else:
@@ -201,117 +375,66 @@ class CfdRunnableFoam(CfdRunnable):
                         self.niter += 1
                     self.in_forces_section = None
                     self.in_forcecoeffs_section = None
+                    self.appendTime()
+                    # A time header can't be anything else
+                    continue
 
             if line.find(u"PIMPLE: iteration ") >= 0 or line.find(u"pseudoTime: iteration ") >= 0:
                 self.latest_outer_iter += 1
                 # Don't increment counter on first outer iter as this was already done with time
                 if self.latest_outer_iter > 1:
                     self.niter += 1
-
-            if line.startswith(u"forces") and (line.endswith(u"write:") or line.endswith(u"execute:")):
-                self.in_forces_section = split[1]
-            if line.startswith(u"forceCoeffs") and (line.endswith(u"write:") or line.endswith(u"execute:")):
-                self.in_forcecoeffs_section = split[1]
+                self.appendTime()
+                continue
+
+            # Don't track monitor sections at all if no such reporting functions
+            # are defined. Lines are only tokenised in the branches that need it
+            if self.forces and line.startswith(u"forces") and \
+                    (line.endswith(u"write:") or line.endswith(u"execute:")):
+                self.in_forces_section = line.split()[1]
+            if self.force_coeffs and line.startswith(u"forceCoeffs") and \
+                    (line.endswith(u"write:") or line.endswith(u"execute:")):
+                self.in_forcecoeffs_section = line.split()[1]
             if not line.strip():
                 # Blank line
                 self.in_forces_section = None
                 self.in_forcecoeffs_section = None
 
-            # Add a point to the time axis for each outer iteration
-            if self.niter > len(self.time):
-                self.time.append(self.latest_time)
-                if self.latest_outer_iter > 0:
-                    # Outer-iteration case
-                    # Create virtual times to space the residuals of the outer iterations nicely on the time graph
-                    self.prev_num_outer_iters = max(self.prev_num_outer_iters, self.latest_outer_iter)
-                    for i in range(self.latest_outer_iter):
-                        self.time[-(self.latest_outer_iter-i)] = self.prev_time + (
-                            self.latest_time-self.prev_time)*((i+1)/self.prev_num_outer_iters)
-
-            if "Ux," in split and self.niter > len(self.UxResiduals):
-                self.UxResiduals.append(float(split[7].split(',')[0]))
-            if "Uy," in split and self.niter > len(self.UyResiduals):
-                self.UyResiduals.append(float(split[7].split(',')[0]))
-            if "Uz," in split and self.niter > len(self.UzResiduals):
-                self.UzResiduals.append(float(split[7].split(',')[0]))
-            if "p," in split and self.niter > len(self.pResiduals):
-                self.pResiduals.append(float(split[7].split(',')[0]))
-            if "p_rgh," in split and self.niter > len(self.pResiduals):
-                self.pResiduals.append(float(split[7].split(',')[0]))
-            if "h," in split and self.niter > len(self.EResiduals):
-                self.EResiduals.append(float(split[7].split(',')[0]))
-            # HiSA coupled residuals
-            if "Residual:" in split and self.niter > len(self.rhoResiduals):
-                self.rhoResiduals.append(float(split[4]))
-                self.UxResiduals.append(float(split[5].lstrip('(')))
-                self.UyResiduals.append(float(split[6]))
-                self.UzResiduals.append(float(split[7].rstrip(')')))
-                self.EResiduals.append(float(split[8]))
-            if "k," in split and self.niter > len(self.kResiduals):
-                self.kResiduals.append(float(split[7].split(',')[0]))
-            if "epsilon," in split and self.niter > len(self.epsilonResiduals):
-                self.epsilonResiduals.append(float(split[7].split(',')[0]))
-            if "omega," in split and self.niter > len(self.omegaResiduals):
-                self.omegaResiduals.append(float(split[7].split(',')[0]))
-            if "nuTilda," in split and self.niter > len(self.nuTildaResiduals):
-                self.nuTildaResiduals.append(float(split[7].split(',')[0]))
-            if "gammaInt," in split and self.niter > len(self.gammaIntResiduals):
-                self.gammaIntResiduals.append(float(split[7].split(',')[0]))
-            if "ReThetat," in split and self.niter > len(self.ReThetatResiduals):
-                self.ReThetatResiduals.append(float(split[7].split(',')[0]))
+            m = RESIDUAL_RE.search(line)
+            if m:
+                self.setResidual(RESIDUAL_COLS[m.group(1)], m.group(2))
+            else:
+                # HiSA coupled residuals
+                m = HISA_RE.search(line)
+                if m:
+                    for field, value in zip(self._HISA_FIELDS, m.groups()):
+                        self.setResidual(RESIDUAL_COLS[field], value)
 
             # Force monitors
             if self.in_forces_section:
                 f = self.forces[self.in_forces_section]
-                if (("Pressure" in split) or ("pressure" in split)) and self.niter-1 > len(f['pressureXForces']):
-                    f['pressureXForces'].append(float(split[2].lstrip("(")))
-                    f['pressureYForces'].append(float(split[3]))
-                    f['pressureZForces'].append(float(split[4].rstrip(")")))
-                if (("Viscous" in split) or ("viscous" in split)) and self.niter-1 > len(f['viscousXForces']):
-                    f['viscousXForces'].append(float(split[2].lstrip("(")))
-                    f['viscousYForces'].append(float(split[3]))
-                    f['viscousZForces'].append(float(split[4].rstrip(")")))
+                m = FORCE_RE.search(line)
+                if m:
+                    prefix = 'pressure' if m.group(1).lower() == 'pressure' else 'viscous'
+                    if self.niter-1 > len(f[prefix + 'XForces']):
+                        f[prefix + 'XForces'].append(float(m.group(2)))
+                        f[prefix + 'YForces'].append(float(m.group(3)))
+                        f[prefix + 'ZForces'].append(float(m.group(4)))
 
             # Force coefficient monitors
             if self.in_forcecoeffs_section:
                 fc = self.force_coeffs[self.in_forcecoeffs_section]
-                if (("Cd" in split) or ("Cd:" in split)) and self.niter-1 > len(fc['cdCoeffs']):
-                    fc['cdCoeffs'].append(float(split[2] if split[1] == '=' else split[1]))
-                if (("Cl" in split) or ("Cl:" in split)) and self.niter-1 > len(fc['clCoeffs']):
-                    fc['clCoeffs'].append(float(split[2] if split[1] == '=' else split[1]))
-
-        # Update plots
-        if self.niter > 1 and self.niter > prev_niter:
-            self.solver.Proxy.residual_plotter.updateValues(self.time, OrderedDict([
-                ('$\\rho$', self.rhoResiduals),
-                ('$U_x$', self.UxResiduals),
-                ('$U_y$', self.UyResiduals),
-                ('$U_z$', self.UzResiduals),
-                ('$p$', self.pResiduals),
-                ('$E$', self.EResiduals),
-                ('$k$', self.kResiduals),
-                ('$\\epsilon$', self.epsilonResiduals),
-                ('$\\tilde{\\nu}$', self.nuTildaResiduals),
-                ('$\\omega$', self.omegaResiduals),
-                ('$\\gamma$', self.gammaIntResiduals),
-                ('$Re_{\\theta}$', self.ReThetatResiduals)]))
-
-            for fn in self.forces:
-                f = self.forces[fn]
-                self.solver.Proxy.forces_plotters[fn].updateValues(self.time, OrderedDict([
-                    ('$Pressure_x$', f['pressureXForces']),
-                    ('$Pressure_y$', f['pressureYForces']),
-                    ('$Pressure_z$', f['pressureZForces']),
-                    ('$Viscous_x$', f['viscousXForces']),
-                    ('$Viscous_y$', f['viscousYForces']),
-                    ('$Viscous_z$', f['viscousZForces'])]))
-
-            for fcn in self.force_coeffs:
-                fc = self.force_coeffs[fcn]
-                self.solver.Proxy.force_coeffs_plotters[fcn].updateValues(self.time, OrderedDict([
-                    ('$C_D$', fc['cdCoeffs']),
-                    ('$C_L$', fc['clCoeffs'])
-                ]))
+                m = COEFF_RE.search(line)
+                if m:
+                    coeffs = fc['cdCoeffs'] if m.group(1) == 'Cd' else fc['clCoeffs']
+                    if self.niter-1 > len(coeffs):
+                        coeffs.append(float(m.group(2)))
+
+        # Update plots at most once per outer iteration, rate-limited so bursts of
+        # solver output don't queue up redundant updates
+        if self.niter > 1 and self.niter > self._last_plotted_niter and \
+                time.monotonic() - self._last_plot_time > 0.1:
+            self.updatePlots()
 
         # Probes
         for pn in self.probes:
@@ -332,15 +455,17 @@ class CfdRunnableFoam(CfdRunnable):
                 for l in p['file'].readlines():
                     l = l.strip()
                     if len(l) and not l.startswith('#'):
+                        # Strip vector brackets in one pass rather than
+                        # lstrip/rstrip on every token
+                        if '(' in l:
+                            is_vector = True
+                            l = l.replace('(', ' ').replace(')', ' ')
                         s = l.split()
                         p['time'].append(float(s[0]))
-                        
-                        if s[1].startswith('('):
-                            is_vector = True
+
                         while len(p['values']) < len(s)-1:
-                            p['values'].append([])
+                            p['values'].append(array.array('d'))
                         for i in range(1, len(s)):
-                            s[i] = s[i].lstrip('(').rstrip(')')
                             p['values'][i-1].append(float(s[i]))
 
                 if len(p['time']) > ntimes:
@@ -358,6 +483,14 @@ class CfdRunnableFoam(CfdRunnable):
                         zip(legends, p['values'])))
 
     def solverFinished(self):
+        # Wait for the parser thread to drain the remaining output
+        if self._parser_thread is not None:
+            self._output_queue.put(None)
+            self._parser_thread.wait()
+            self._parser_thread = None
+        # Flush any iterations accumulated since the last throttled update
+        if self.niter > 1 and self.niter > self._last_plotted_niter:
+            self.updatePlots()
         for pn in self.probes:
             p = self.probes[pn]
             if p['file']: